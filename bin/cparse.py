@@ -8,9 +8,12 @@
 # Creation date     : 2014-12-18
 # Last modification : 2016-11-15
 # -----------------------------------------------------------------------------
-import os, sys, re, fnmatch
+import os, sys, re, io, fnmatch
 import reporter, texto, templating
 
+if sys.version_info.major >= 3:
+	unicode = str
+
 VERSION = "0.0.0"
 LICENSE = "http://ffctn.com/doc/licenses/bsd"
 
@@ -165,7 +168,7 @@ class Library:
 	def parse( self, *paths ):
 		for path in paths:
 			if not path: continue
-			with file(path, "r") as f:
+			with io.open(path, "r", encoding="utf8") as f:
 				self.addGroups(Parser.Groups(Parser.Lines(f.read())))
 		return self
 
@@ -276,7 +279,7 @@ class Parser:
 			if group.type == TYPE_SYMBOL:
 				first_line = None
 				try:
-					first_line  = (_ for _ in group.code if _).next()
+					first_line  = next(_ for _ in group.code if _)
 				except StopIteration:
 					reporter.error("Group has no code: {0}".format(group))
 				if first_line:
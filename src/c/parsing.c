@@ -30,6 +30,42 @@ Match FAILURE_S = {
 
 Match* FAILURE = &FAILURE_S;
 
+// ----------------------------------------------------------------------------
+//
+// MATCH ARENA (DECLARATIONS)
+//
+// ----------------------------------------------------------------------------
+
+// NOTE: The match arena is private to the parser, so it is declared here
+// and not in `parsing.h`, which is used to generate the FFI interface.
+
+// The number of matches allocated at once by a `MatchArena`.
+#define MATCH_ARENA_BLOCK 1024
+
+typedef struct MatchBlock {
+	struct MatchBlock* next;     // The previously allocated block
+	size_t             used;     // The number of matches used in this block
+	Match              matches[MATCH_ARENA_BLOCK];
+} MatchBlock;
+
+// Allocates matches by blocks, recycling the matches that were freed. The
+// matches of an arena are all deallocated at once when it is freed,
+// which happens when the parsing context that owns it is freed.
+typedef struct MatchArena {
+	MatchBlock*     blocks;      // The blocks, the current one first
+	Match*          recycled;    // The freed matches, linked through `next`
+} MatchArena;
+
+MatchArena* MatchArena_new(void);
+
+void MatchArena_free(MatchArena* this);
+
+// Returns an uninitialized match, recycled or taken from the current block.
+Match* MatchArena_alloc(MatchArena* this);
+
+// Makes the given match available to `MatchArena_alloc` again.
+void MatchArena_recycle(MatchArena* this, Match* match);
+
 // ----------------------------------------------------------------------------
 //
 // LOGGING
@@ -483,7 +519,8 @@ void Grammar_free(Grammar* this) {
 // ----------------------------------------------------------------------------
 
 Match* Match__Success(size_t length, Element* element, ParsingContext* context) {
-	NEW(Match,this);
+	// Matches are allocated from the context's arena, when there is one
+	Match* this = context->matches != NULL ? MatchArena_alloc(context->matches) : Match_new();
 	assert( element != NULL );
 	this->status   = STATUS_MATCHED;
 	this->offset   = context->iterator->offset;
@@ -495,6 +532,8 @@ Match* Match__Success(size_t length, Element* element, ParsingContext* context)
 	this->next     = NULL;
 	this->children = NULL;
 	this->parent   = NULL;
+	this->result   = NULL;
+	this->arena    = context->matches;
 	return this;
 }
 
@@ -519,11 +558,10 @@ Match* Match_new(void) {
 	this->children  = NULL;
 	this->parent    = NULL;
 	this->result    = NULL;
+	this->arena     = NULL;
 	return this;
 }
 
-// TODO: We might want to recycle the objects for better performance and
-// fewer allocs.
 void* Match_free(Match* this) {
 	if (this!=NULL && this!=FAILURE) {
 		TRACE("Match_free(%c:%d@%s,%lu-%lu):%p", ((ParsingElement*)this->element)->type, ((ParsingElement*)this->element)->id, ((ParsingElement*)this->element)->name, this->offset, this->offset + this->length, this)
@@ -556,8 +594,12 @@ void* Match_free(Match* this) {
 			}
 
 		}
-		// We deallocate this one
-		__FREE(this);
+		// We deallocate this one, or give it back to its arena
+		if (this->arena != NULL) {
+			MatchArena_recycle(this->arena, this);
+		} else {
+			__FREE(this);
+		}
 	}
 	return NULL;
 }
@@ -626,14 +668,40 @@ bool Match_isSuccess(Match* this) {
 	return (this != NULL && this != FAILURE && this->status == STATUS_MATCHED);
 }
 
+// The initial size of the explicit stacks used by the walks, which are grown
+// as needed.
+#define MATCH_WALK_STACK   64
+#define ELEMENT_WALK_STACK 64
+
+// NOTE: The walk is iterative, the matches whose next sibling is yet to be
+// walked are kept in an explicit stack, so that deep match trees don't
+// overflow the C stack. The steps are the same as a recursive pre-order
+// walk of the children then the next sibling.
 int Match__walk(Match* this, MatchWalkingCallback callback, int step, void* context ){
-	step = callback(this, step, context);
-	if (this->children != NULL && step >= 0) {
-		step = Match__walk(this->children, callback, step + 1, context);
-	}
-	if (this->next != NULL && step >= 0) {
-		step = Match__walk(this->next, callback, step + 1, context);
+	int capacity = MATCH_WALK_STACK;
+	int top      = 0;
+	__ARRAY_NEW(stack, Match*, capacity);
+	Match* match = this;
+	while (match != NULL) {
+		step = callback(match, step, context);
+		if (step < 0) {break;}
+		if (match->children != NULL) {
+			if (match->next != NULL) {
+				if (top == capacity) {
+					capacity = capacity * 2;
+					__ARRAY_RESIZE(stack, Match*, capacity);
+				}
+				stack[top++] = match->next;
+			}
+			match = match->children;
+		} else if (match->next != NULL) {
+			match = match->next;
+		} else {
+			match = top > 0 ? stack[--top] : NULL;
+		}
+		step += match != NULL ? 1 : 0;
 	}
+	__FREE(stack);
 	return step;
 }
 
@@ -662,6 +730,34 @@ int Match_countAll(Match* this) {
 	return Match__walk(this, Match__walkCounter, 0, NULL);
 }
 
+// The state shared by the `*__collect` functions, which store the walked
+// objects in a caller-allocated array.
+typedef struct Collector {
+	void** out;
+	int*   depths;
+	int    capacity;
+	int    count;
+	int    maxDepth;
+} Collector;
+
+int Match__collectCallback (Match* this, int step, void* context) {
+	Collector* c = (Collector*)context;
+	if (c->count < c->capacity) {c->out[c->count] = this;}
+	c->count++;
+	return step;
+}
+
+int Match__collect(Match* this, void** out, int capacity) {
+	Collector c = {out, NULL, capacity, 0, -1};
+	// NOTE: We can't use `Match__walk` on this match directly, as it would
+	// also walk its next siblings.
+	if (this != NULL) {
+		Match__collectCallback(this, 0, &c);
+		if (this->children != NULL) {Match__walk(this->children, Match__collectCallback, 1, &c);}
+	}
+	return c.count;
+}
+
 int Match_countChildren(Match* this) {
 	int count = 0;
 	Match* child = this->children;
@@ -672,6 +768,52 @@ int Match_countChildren(Match* this) {
 	return count;
 }
 
+// ----------------------------------------------------------------------------
+//
+// MATCH ARENA
+//
+// ----------------------------------------------------------------------------
+
+MatchArena* MatchArena_new(void) {
+	__NEW(MatchArena, this);
+	this->blocks   = NULL;
+	this->recycled = NULL;
+	return this;
+}
+
+void MatchArena_free(MatchArena* this) {
+	if (this != NULL) {
+		MatchBlock* block = this->blocks;
+		while (block != NULL) {
+			MatchBlock* next = block->next;
+			__FREE(block);
+			block = next;
+		}
+	}
+	__FREE(this);
+}
+
+Match* MatchArena_alloc(MatchArena* this) {
+	Match* match = this->recycled;
+	if (match != NULL) {
+		this->recycled = match->next;
+	} else {
+		if (this->blocks == NULL || this->blocks->used == MATCH_ARENA_BLOCK) {
+			__NEW(MatchBlock, block);
+			block->next  = this->blocks;
+			block->used  = 0;
+			this->blocks = block;
+		}
+		match = &(this->blocks->matches[this->blocks->used++]);
+	}
+	return match;
+}
+
+void MatchArena_recycle(MatchArena* this, Match* match) {
+	match->next    = this->recycled;
+	this->recycled = match;
+}
+
 // ============================================================================
 // JSON FORMATTING
 // ============================================================================
@@ -1077,20 +1219,7 @@ int ParsingElement_walk( ParsingElement* this, ElementWalkingCallback callback,
 
 int ParsingElement__walk( ParsingElement* this, ElementWalkingCallback callback, int step, void* context ) {
 	TRACE("ParsingElement__walk: %4d %c %-20s [%4d]", this->id, this->type, this->name, step);
-	int i = step;
-	step  = callback((Element*)this, step, context);
-	Reference* child = this->children;
-	while ( child != NULL && step >= 0) {
-		// We are sure here that the child is a reference, so we can
-		// call Reference__walk directly.
-		assert(Reference_Is(child));
-		int j = Reference__walk(child, callback, ++i, context);
-		// We need to break the loop whenever this returns < 0
-		if (j > 0) { step = i = j; }
-		else {break;}
-		child = child->next;
-	}
-	return (step > 0) ? step : i;
+	return Element__walk((Element*)this, callback, step, context);
 }
 
 // ----------------------------------------------------------------------------
@@ -1103,19 +1232,127 @@ int Element_walk( Element* this, ElementWalkingCallback callback, void* context
 	return Element__walk(this, callback, 0, context);
 }
 
-int Element__walk( Element* this, ElementWalkingCallback callback, int step, void* context ) {
-	assert (callback != NULL);
-	TRACE("Element__walk     = %4d", step);
-	if (this!=NULL) {
-		if (Reference_Is(this)) {
-			step = Reference__walk((Reference*)this, callback, step, context);
-		} else if (ParsingElement_Is(this)) {
-			step = ParsingElement__walk((ParsingElement*)this, callback, step, context);
+// A frame of the explicit stack used by `Element__walkFrames`, holding the
+// state of the walk of a parsing element's children.
+typedef struct ElementWalkFrame {
+	ParsingElement* element;
+	Reference*      child;     // The next child to walk, NULL once done
+	int             i;         // The step of the last walked child
+	int             step;      // The step returned by the last walked child
+	int             depth;
+} ElementWalkFrame;
+
+bool Element__walkBoundedVisit( Element* this, int step, int depth, Collector* c ) {
+	// Elements are only visited once, at the step that was used as their
+	// id by `Grammar_prepare`.
+	if (step > this->id) {return FALSE;}
+	if (c->maxDepth < 0 || depth <= c->maxDepth) {
+		if (c->count < c->capacity) {
+			c->out[c->count] = this;
+			if (c->depths != NULL) {c->depths[c->count] = depth;}
+		}
+		c->count++;
+	}
+	return TRUE;
+}
+
+int Element__walkVisit( Element* this, int step, int depth, ElementWalkingCallback callback, void* context ) {
+	if (callback != NULL) {return callback(this, step, context);}
+	return Element__walkBoundedVisit(this, step, depth, (Collector*)context) ? step : -1;
+}
+
+// NOTE: The walk is iterative, using an explicit stack of frames instead of
+// recursing for each reference, so that deep grammars don't overflow the
+// C stack. The steps are those of the original recursive walk: a reference
+// is followed by its element, the children of a parsing element are walked
+// at consecutive steps, and stop as soon as one of them returns a
+// non-positive step. When `callback` is NULL, the elements are collected
+// in the `Collector` given as context.
+int Element__walkFrames( Element* this, ElementWalkingCallback callback, int step, void* context ) {
+	if (this == NULL) {return step;}
+	ParsingElement* element = NULL;
+	int depth = 0;
+	if (Reference_Is(this)) {
+		step = Element__walkVisit(this, step, depth, callback, context);
+		if (step < 0) {return step;}
+		assert(!Reference_Is(((Reference*)this)->element));
+		element = ((Reference*)this)->element;
+		step    = step + 1;
+		depth   = 1;
+	} else if (ParsingElement_Is(this)) {
+		element = (ParsingElement*)this;
+	} else {
+		assert(FALSE);
+		return step;
+	}
+	int capacity = ELEMENT_WALK_STACK;
+	int top      = -1;
+	int result   = step;
+	__ARRAY_NEW(stack, ElementWalkFrame, capacity);
+	while (TRUE) {
+		ElementWalkFrame* frame = NULL;
+		if (element != NULL) {
+			// We enter the element, pushing a new frame
+			if (top + 1 == capacity) {
+				capacity = capacity * 2;
+				__ARRAY_RESIZE(stack, ElementWalkFrame, capacity);
+			}
+			frame = &stack[++top];
+			frame->element = element;
+			frame->i       = step;
+			frame->step    = Element__walkVisit((Element*)element, step, depth, callback, context);
+			frame->child   = frame->step >= 0 ? element->children : NULL;
+			frame->depth   = depth;
+			element        = NULL;
+		}
+		frame = &stack[top];
+		if (frame->child != NULL) {
+			// We are sure here that the child is a reference
+			Reference* child = frame->child;
+			assert(Reference_Is(child));
+			result = Element__walkVisit((Element*)child, ++frame->i, frame->depth + 1, callback, context);
+			if (result >= 0) {
+				// The child's element is walked in a new frame, its result
+				// being the child's result.
+				assert(!Reference_Is(child->element));
+				element = child->element;
+				step    = result + 1;
+				depth   = frame->depth + 2;
+				continue;
+			}
+		} else {
+			// We're done with the element's children, so we pop the frame
+			// and pass the result to the parent frame.
+			result = (frame->step > 0) ? frame->step : frame->i;
+			if (top == 0) {break;}
+			frame = &stack[--top];
+		}
+		// We need to break the loop whenever the child returns <= 0
+		if (result > 0) {
+			frame->step  = frame->i = result;
+			frame->child = frame->child->next;
 		} else {
-			assert(FALSE);
+			frame->child = NULL;
 		}
 	}
-	return step;
+	__FREE(stack);
+	return result;
+}
+
+int Element__walk( Element* this, ElementWalkingCallback callback, int step, void* context ) {
+	assert (callback != NULL);
+	TRACE("Element__walk     = %4d", step);
+	return Element__walkFrames(this, callback, step, context);
+}
+
+int Element__walkBounded( Element* this, int maxDepth, void** out, int* depths, int capacity ) {
+	Collector c = {out, depths, capacity, 0, maxDepth};
+	Element__walkFrames(this, NULL, 0, &c);
+	return c.count;
+}
+
+int Element__collect( Element* this, void** out, int capacity ) {
+	return Element__walkBounded(this, -1, out, NULL, capacity);
 }
 
 // ----------------------------------------------------------------------------
@@ -1198,12 +1435,7 @@ Reference* Reference_name(Reference* this, const char* name) {
 
 int Reference__walk( Reference* this, ElementWalkingCallback callback, int step, void* context ) {
 	TRACE("Reference__walk     : %4d %c %-20s [%4d]", this->id, this->type, this->name, step);
-	step = callback((Element*)this, step, context);
-	if (step >= 0) {
-		assert(!Reference_Is(this->element));
-		step = ParsingElement__walk(this->element, callback, step + 1, context);
-	}
-	return step;
+	return Element__walk((Element*)this, callback, step, context);
 }
 
 Match* Reference_recognize(Reference* this, ParsingContext* context) {
@@ -1374,6 +1606,10 @@ ParsingElement* Word_new(const char* word) {
 	return this;
 }
 
+ParsingElement* Word_newNamed(const char* name, const char* word) {
+	return ParsingElement_name(Word_new(word), name);
+}
+
 // TODO: Implement Word_free and regfree
 void Word_free(ParsingElement* this) {
 	// TRACE("Word_free: %p", this)
@@ -1452,26 +1688,52 @@ ParsingElement* Token_new(const char* expr) {
 		return NULL;
 	}
 #endif
+	config->refs = 1;
 	this->config = config;
 	assert(strcmp(config->expr, expr) == 0);
 	assert(strcmp(Token_expr(this), expr) == 0);
 	return this;
 }
 
+ParsingElement* Token_newNamed(const char* name, const char* expr) {
+	return ParsingElement_name(Token_new(expr), name);
+}
+
+ParsingElement* Token_newShared(void* config, const char* name) {
+	assert(config != NULL);
+	ParsingElement* this = ParsingElement_new(NULL);
+	this->type           = TYPE_TOKEN;
+	this->recognize      = Token_recognize;
+	this->freeMatch      = TokenMatch_free;
+	this->config         = config;
+	((TokenConfig*)config)->refs++;
+	if (name != NULL) {ParsingElement_name(this, name);}
+	return this;
+}
 
 void Token_free(ParsingElement* this) {
+	Token_release(this->config);
+	if (this!=NULL) {__FREE(this->name)};
+	__FREE(this);
+}
+
+void* Token_retain(ParsingElement* this) {
 	TokenConfig* config = (TokenConfig*)this->config;
-	if (config != NULL) {
+	config->refs++;
+	return config;
+}
+
+void Token_release(void* config) {
+	TokenConfig* this = (TokenConfig*)config;
+	if (this != NULL && --this->refs <= 0) {
 		// FIXME: Not sure how to free a regexp
 #ifdef WITH_PCRE
-		if (config->regexp != NULL) {pcre_free(config->regexp);}
-		if (config->extra  != NULL) {pcre_free_study(config->extra);}
+		if (this->regexp != NULL) {pcre_free(this->regexp);}
+		if (this->extra  != NULL) {pcre_free_study(this->extra);}
 #endif
-		__FREE(config->expr);
-		__FREE(config);
+		__FREE(this->expr);
+		__FREE(this);
 	}
-	if (this!=NULL) {__FREE(this->name)};
-	__FREE(this);
 }
 
 const char* Token_expr(ParsingElement* this) {
@@ -1615,6 +1877,10 @@ ParsingElement* Group_new(Reference* children[]) {
 	return this;
 }
 
+ParsingElement* Group_newNamed(const char* name, Reference* children[]) {
+	return ParsingElement_name(Group_new(children), name);
+}
+
 Match* Group_recognize(ParsingElement* this, ParsingContext* context){
 
 	// The goal is to find ONE (and only one) matching element.
@@ -1681,6 +1947,10 @@ ParsingElement* Rule_new(Reference* children[]) {
 	return this;
 }
 
+ParsingElement* Rule_newNamed(const char* name, Reference* children[]) {
+	return ParsingElement_name(Rule_new(children), name);
+}
+
 Match* Rule_recognize (ParsingElement* this, ParsingContext* context){
 
 	// An empty rule will fail. Not sure if this is the right thing to do, but
@@ -1978,6 +2248,7 @@ ParsingContext* ParsingContext_new( Grammar* g, Iterator* iterator ) {
 	this->lastMatchOffset = 0;
 	this->lastMatchLength = 0;
 	this->lastMatchElementID = -1;
+	this->matches   = MatchArena_new();
 	return this;
 }
 
@@ -1987,6 +2258,7 @@ void ParsingContext_free( ParsingContext* this ) {
 		if (this->freeIterator) {Iterator_free(this->iterator);}
 		ParsingVariable_freeAll(this->variables);
 		ParsingStats_free(this->stats);
+		MatchArena_free(this->matches);
 		__FREE(this);
 	}
 }
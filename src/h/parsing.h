@@ -372,6 +372,22 @@ int Element_walk( Element* this, ElementWalkingCallback callback, void* context)
 // @method
 int Element__walk( Element* this, ElementWalkingCallback callback, int step, void* context);
 
+// @method
+// Collects the elements reachable from this element into the `out` array
+// (of `capacity` slots), in the same order as `Element_walk`. Elements
+// that were already visited (ie. whose id is lower than the current step, see
+// `Grammar_prepare`) are not traversed again. Returns the total number of
+// elements, which can be greater than `capacity`, in which case the
+// caller should retry with a bigger array.
+int Element__collect( Element* this, void** out, int capacity );
+
+// @method
+// Like `Element__collect`, but also stores the depth of each element in the
+// `depths` array (when not NULL), only storing the elements that are at most
+// `maxDepth` deep (all of them when `maxDepth` is negative). Returns
+// the total number of stored elements.
+int Element__walkBounded( Element* this, int maxDepth, void** out, int* depths, int capacity );
+
 /**
  * ### Parsing Elements
  *
@@ -403,6 +419,7 @@ typedef struct Match {
 	struct Match*   children;  // A pointer to the child match (see `References`)
 	struct Match*   parent;    // A pointer to the parent match
 	void*           result;    // A pointer to the result of the match
+	struct MatchArena* arena;  // The arena the match was allocated from, if any
 } Match;
 
 // @define
@@ -537,6 +554,13 @@ const char* Match_getElementName(Match* this);
 // traversal when `callbacks` return 0 or less.
 int Match__walk(Match* this, MatchWalkingCallback callback, int step, void* context );
 
+// @method
+// Collects this match and its descendants (depth-first traversal, like
+// `Match__walk`, but without this match's next siblings) into the `out`
+// array (of `capacity` slots). Returns the total number of matches, which
+// can be greater than `capacity`.
+int Match__collect(Match* this, void** out, int capacity);
+
 // @method
 int Match_countAll(Match* this);
 
@@ -645,6 +669,11 @@ typedef struct WordConfig {
 // @constructor
 ParsingElement* Word_new(const char* word);
 
+// @constructor
+// Creates a new word with the given name, which saves a call to
+// `ParsingElement_name`.
+ParsingElement* Word_newNamed(const char* name, const char* word);
+
 // @destructor
 void Word_free(ParsingElement* this);
 
@@ -672,6 +701,7 @@ const char* WordMatch_group(Match* match);
 // `Token` methods.
 typedef struct TokenConfig {
 	char* expr;
+	int   refs;          // The number of tokens (and retainers) sharing the configuration
 #ifdef WITH_PCRE
 	pcre*       regexp;
 	pcre_extra* extra;
@@ -689,9 +719,30 @@ typedef struct TokenMatch {
 // Creates a new token with the given POSIX extended regular expression
 ParsingElement* Token_new(const char* expr);
 
+// @method
+// Creates a new token with the given name and expression.
+ParsingElement* Token_newNamed(const char* name, const char* expr);
+
+// @method
+// Creates a new token that shares the given token configuration, as
+// returned by `Token_retain`, instead of compiling its expression again.
+// The name is optional.
+ParsingElement* Token_newShared(void* config, const char* name);
+
 // @destructor
 void Token_free(ParsingElement*);
 
+// @method
+// Retains the configuration (and thus the compiled expression) of the given
+// token, so that it can be passed to `Token_newShared` even after the token
+// is freed. The configuration must be released with `Token_release`.
+void* Token_retain(ParsingElement* this);
+
+// @method
+// Releases a configuration retained with `Token_retain`, freeing it when
+// no token uses it anymore.
+void Token_release(void* config);
+
 // @method
 // The specialized match function for token parsing elements.
 Match* Token_recognize(ParsingElement* this, ParsingContext* context);
@@ -805,6 +856,9 @@ Match* Reference_recognize(Reference* this, ParsingContext* context);
 // @constructor
 ParsingElement* Group_new(Reference* children[]);
 
+// @constructor
+ParsingElement* Group_newNamed(const char* name, Reference* children[]);
+
 // @method
 Match*          Group_recognize(ParsingElement* this, ParsingContext* context);
 
@@ -818,6 +872,9 @@ Match*          Group_recognize(ParsingElement* this, ParsingContext* context);
 // @constructor
 ParsingElement* Rule_new(Reference* children[]);
 
+// @constructor
+ParsingElement* Rule_newNamed(const char* name, Reference* children[]);
+
 // @method
 Match*          Rule_recognize(ParsingElement* this, ParsingContext* context);
 
@@ -967,6 +1024,7 @@ typedef struct ParsingContext {
 	const char*             indent;
 	int                     flags;
 	bool                    freeIterator;
+	struct MatchArena*      matches;      // The arena used to allocate matches
 } ParsingContext;
 
 
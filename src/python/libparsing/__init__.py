@@ -11,7 +11,7 @@
 
 from __future__ import print_function
 
-import sys, os, re, glob, inspect, tempfile, collections
+import sys, os, re, glob, inspect, tempfile, collections, weakref, threading
 from   cffi    import FFI
 from   os.path import dirname, join, abspath
 
@@ -46,17 +46,11 @@ LIBPARSING_EXT = None
 LIBPARSING_SO  = None
 LIBRARY_EXTS   = ("so", "dylib", "dll")
 
-# We check if there is a _libparsing SO/DYLIB/DLL file. If not, we need to
-# build it using CFFI.
-from . import _buildext
-if len([_ for _ in LIBRARY_EXTS if os.path.exists(join(PACKAGE_PATH, _buildext.filename(_)))]) == 0:
-	logging.info("Building native libparsing Python bindings‥")
-	_buildext.build()
-
-# Now we look for the actual Python extension (_libparsing
+# We look for the actual Python extension (_libparsing
 # We need to support different extensions and different prefixes. CFFI
 # will build extensions as " _libparsing.cpython-35m-x86_64-linux-gnu.so"
 # on Linux.
+from . import _buildext
 PREFIX_EXT = _buildext.name() + "."
 PREFIX_SO  = "libparsing."
 for p in os.listdir(PACKAGE_PATH):
@@ -65,6 +59,18 @@ for p in os.listdir(PACKAGE_PATH):
 	if p.startswith(PREFIX_SO)  and p.rsplit(".",1)[-1] in LIBRARY_EXTS:
 		LIBPARSING_SO  = os.path.join(PACKAGE_PATH, p)
 
+# If there is no extension for this Python version, we build it using CFFI.
+# NOTE: The extension (API mode) is always preferred, as calls through
+# `dlopen` (ABI mode) go through libffi, which is much slower. The shared
+# library is only used when the extension cannot be built.
+if not LIBPARSING_EXT:
+	logging.info("Building native libparsing Python bindings‥")
+	try:
+		LIBPARSING_EXT = _buildext.build()
+	except Exception as e:
+		if not LIBPARSING_SO: raise
+		logging.warn("libparsing: Cannot build the Python extension, using {0} instead: {1}".format(LIBPARSING_SO, e))
+
 if LIBPARSING_EXT:
 	# Using the EXT instead of the SO (ie. API vs ABI mode) improves performance
 	# by ~25%, but the extension needs to be compiled specifically for the python
@@ -80,6 +86,16 @@ elif LIBPARSING_SO:
 	lib = ffi.dlopen(LIBPARSING_SO)
 assert lib, "libparsing: Cannot find libparsing.{{so,dll,dylib}} or _libparsing[.*].{{so,dll,dylib}} in package {0}".format(PACKAGE_PATH)
 
+# We bind the FFI functions used in hot paths (grammar construction, walks
+# and wrapping) as module globals, which saves attribute lookups.
+_ffi_cast                  = ffi.cast
+_ffi_string                = ffi.string
+_lib_ParsingElement_add    = lib.ParsingElement_add
+_lib_ParsingElement_name   = lib.ParsingElement_name
+_lib_Reference_Ensure      = lib.Reference_Ensure
+_lib_Reference_Is          = lib.Reference_Is
+_lib_Reference_cardinality = lib.Reference_cardinality
+
 # -----------------------------------------------------------------------------
 #
 # GLOBALS
@@ -107,6 +123,19 @@ STATUS_INPUT_ENDED        = b'.'
 STATUS_ENDED              = b'E'
 ID_BINDING                = -1
 ID_UNBOUND                = -10
+WALK_CAPACITY             = 4096
+WALK_POOL_SIZE            = 8
+
+# Walks are done by collecting the walked C objects in a single call, which
+# avoids one FFI callback per object. Older libparsing builds don't have
+# the `*__collect` functions, in which case we fallback to callbacks.
+HAS_COLLECT               = hasattr(lib, "Element__collect") and hasattr(lib, "Match__collect")
+
+# Tokens with the same expression share their compiled regular expression,
+# which is retained in `_TOKEN_CACHE` by expression, even across grammars,
+# for as long as a `Token` wrapper uses it. Older libparsing builds compile
+# each token's expression.
+HAS_TOKEN_SHARED          = hasattr(lib, "Token_newShared")
 
 if sys.version_info.major >= 3:
 	def ensure_bytes(v):
@@ -145,6 +174,87 @@ else:
 	def is_string( v ):
 		return isinstance(v,str) or isinstance(v,unicode)
 
+# The arrays used by walks are pooled, at most `WALK_POOL_SIZE` per type, so
+# that repeated walks don't allocate (and zero) a new array each time. Only
+# arrays of `WALK_CAPACITY` are pooled, grown arrays are simply dropped.
+_walkBuffers = {
+	"void*[]" : collections.deque(),
+	"int[]"   : collections.deque(),
+}
+
+def _acquire( ctype, capacity=WALK_CAPACITY ):
+	"""Returns an array of the given type and capacity, reusing a pooled
+	one when possible."""
+	if capacity == WALK_CAPACITY:
+		try:
+			return _walkBuffers[ctype].pop()
+		except IndexError:
+			pass
+	return ffi.new(ctype, capacity)
+
+def _release( ctype, buffer ):
+	"""Gives back an array obtained from `_acquire` to the pool."""
+	pool = _walkBuffers[ctype]
+	if len(buffer) == WALK_CAPACITY and len(pool) < WALK_POOL_SIZE:
+		pool.append(buffer)
+
+def _collect( collector, cobject, capacity=WALK_CAPACITY ):
+	"""Calls the given `*__collect` C function on the given C object, returning
+	a `(void*[], count)` couple. The array is grown when the C function
+	reports more objects than it could store. The array should be given
+	back using `_release("void*[]", array)` once done with it."""
+	buffer = _acquire("void*[]", capacity)
+	count  = collector(cobject, buffer, capacity)
+	if count > capacity:
+		_release("void*[]", buffer)
+		buffer = _acquire("void*[]", count)
+		count  = collector(cobject, buffer, count)
+	return buffer, count
+
+# The state of the callback-based walks, as a `[callback, stoppedStep]` list
+# per thread. The C callbacks below are created once, as creating a CFFI
+# callback per walk is expensive and the callbacks are never freed.
+_walking = threading.local()
+
+@ffi.callback("int(*)(Element*, int, void*)")
+def _elementWalkingCallback( e, step, context ):
+	state = _walking.element
+	# Elements that were already visited have an id lower than
+	# the current step.
+	if state[1] is not None or step > e.id: return -1
+	e = Reference.Wrap(e) if _lib_Reference_Is(e) else ParsingElement.Wrap(e)
+	r = state[0](e, step)
+	if r is not None and r < 0:
+		state[1] = step
+		return -1
+	return step
+
+@ffi.callback("int(*)(Match*, int, void*)")
+def _matchWalkingCallback( m, step, context ):
+	state = _walking.match
+	if state[1] is not None: return -1
+	r = state[0](Match.Wrap(m), step)
+	if r is not None and r < 0:
+		state[1] = step
+		return -1
+	return step
+
+def _walk( name, callback, walk ):
+	"""Invokes `walk()`, which is expected to call a C walk function with one
+	of the callbacks above, setting `callback` as the `_walking.<name>` state."""
+	previous = getattr(_walking, name, None)
+	state    = [callback, None]
+	setattr(_walking, name, state)
+	try:
+		step = walk()
+	finally:
+		setattr(_walking, name, previous)
+	return step if state[1] is None else state[1]
+
+def _address( cobject ):
+	"""Returns the address of the given C object as an integer."""
+	return int(_ffi_cast("uintptr_t", cobject))
+
 # -----------------------------------------------------------------------------
 #
 # C OJBECT ABSTRACTION
@@ -165,20 +275,31 @@ class CObject(object):
 	attribute is set, the cbjects will be appended to the `_RECYCLER` class
 	stack on `__del__`, and the instance can be reused by calling
 	`Reuse(pointer)`.
+
+	Wrapped objects are cached by address, so that wrapping the same
+	C object twice returns the same instance for as long as it is alive.
 	"""
 
+	__slots__   = ("_cobject", "_hash", "__weakref__")
+
 	_TYPE       = None
 	_RECYCLER   = None
 	_RECYCLABLE = False
+	_CACHE      = weakref.WeakValueDictionary()
 
 	@classmethod
 	def Wrap( cls, cobject ):
-		return cls(cobject, wrap=cls.TYPE()) if cobject != ffi.NULL else None
+		if cobject == ffi.NULL: return None
+		o = CObject._CACHE.get(_address(cobject))
+		if o is None or not isinstance(o, cls):
+			o = cls.Reuse(cobject) or cls(cobject, wrap=cls.TYPE())
+		return o
 
 	@classmethod
 	def Recycle( cls, wrapped ):
 		if cls._RECYCLER is None: cls._RECYCLER = []
 		wrapped._cobject = None
+		wrapped._hash    = None
 		cls._RECYCLER.append(wrapped)
 
 	@classmethod
@@ -197,17 +318,19 @@ class CObject(object):
 
 	def __init__(self, *args, **kwargs):
 		self._cobject = None
+		self._hash    = None
 		self._init()
 		if "wrap" in kwargs:
 			assert len(kwargs) == 1
 			assert len(args  ) == 1
-			self._wrap(ffi.cast(kwargs["wrap"], args[0]))
+			self._wrap(_ffi_cast(kwargs["wrap"], args[0]))
 		elif "empty" in kwargs:
 			pass
 		else:
 			o = self._new(*args, **kwargs)
-			if o is not None: self._cobject = ffi.cast(self.TYPE(), o)
+			if o is not None: self._cobject = _ffi_cast(self.TYPE(), o)
 			assert self._cobject
+			CObject._CACHE[_address(self._cobject)] = self
 
 	def _init( self ):
 		pass
@@ -224,8 +347,27 @@ class CObject(object):
 		#assert isinstance(cobject, FFI.CData), "%s: Trying to wrap non CData value: %s" % (self.__class__.__name__, cobject)
 		assert cobject != ffi.NULL, "%s: Trying to wrap NULL value: %s" % (self.__class__.__name__, cobject)
 		self._cobject = cobject
+		CObject._CACHE[_address(cobject)] = self
 		return self
 
+	def __hash__( self ):
+		# NOTE: The hash is frozen once computed, as the C object is detached
+		# (set to None) when it is freed, which would otherwise change it.
+		if self._hash is None:
+			self._hash = _address(self._cobject) if self._cobject else id(self)
+		return self._hash
+
+	def __eq__( self, other ):
+		if self is other:
+			return True
+		elif isinstance(other, CObject) and self._cobject and other._cobject:
+			return _address(self._cobject) == _address(other._cobject)
+		else:
+			return False
+
+	def __ne__( self, other ):
+		return not self.__eq__(other)
+
 	def __del__( self ):
 		if self.__class__._RECYCLABLE:
 			self.__class__.Recycle(self)
@@ -238,8 +380,13 @@ class CObject(object):
 
 class ParsingElement(CObject):
 
+	__slots__ = ("_name", "_nameCache")
+
 	_TYPE = "ParsingElement*"
 
+	def _init( self ):
+		self._nameCache = NOTHING
+
 	@classmethod
 	def IsCType( self, element ):
 		return isinstance(element, FFI.CData) and lib.ParsingElement_Is(element)
@@ -249,13 +396,17 @@ class ParsingElement(CObject):
 
 	@property
 	def name( self ):
-		name = self._cobject.name
-		return ensure_str(ffi.string(name)) if name else None
+		# NOTE: Names are cached, as they are only changed through the setter
+		if self._nameCache is NOTHING:
+			name = self._cobject.name
+			self._nameCache = ensure_str(_ffi_string(name)) if name else None
+		return self._nameCache
 
 	@name.setter
 	def name( self, name ):
-		self._name = ensure_bytes(name)
-		lib.ParsingElement_name(self._cobject, self._name)
+		self._name      = ensure_bytes(name)
+		self._nameCache = NOTHING
+		_lib_ParsingElement_name(self._cobject, self._name)
 		return self
 
 	@property
@@ -271,8 +422,10 @@ class ParsingElement(CObject):
 
 	def add( self, *children ):
 		for c in children:
-			assert isinstance(c, ParsingElement) or isinstance(c, Reference)
-			lib.ParsingElement_add(self._cobject, lib.Reference_Ensure(c._cobject))
+			assert isinstance(c, _ELEMENT_TYPES)
+			# References don't need to go through `Reference_Ensure`
+			r = c._cobject if isinstance(c, Reference) else _lib_Reference_Ensure(c._cobject)
+			_lib_ParsingElement_add(self._cobject, r)
 		return self
 
 	def _as( self, name ):
@@ -292,9 +445,13 @@ class ParsingElement(CObject):
 		return Reference(self).oneOrMore()
 
 	def disableMemoize( self ):
+		"""Kept for compatibility with grammars written for memoizing (packrat)
+		parsers. libparsing does not memoize matches, so there is nothing to
+		disable and this returns the element as-is."""
 		return self
 
 	def disableFailMemoize( self ):
+		"""Like `disableMemoize`, failed matches are not memoized either."""
 		return self
 
 	def skip( self, value=True ):
@@ -348,9 +505,14 @@ class ParsingElement(CObject):
 
 class Word(ParsingElement):
 
-	def _new( self, word):
+	__slots__ = ("_word",)
+
+	def _new( self, word, name=None ):
 		self._word = ensure_bytes(word)
-		return lib.Word_new(self._word)
+		if name is None:
+			return lib.Word_new(self._word)
+		self._name = ensure_bytes(name)
+		return lib.Word_newNamed(self._name, self._word)
 
 # -----------------------------------------------------------------------------
 #
@@ -358,11 +520,37 @@ class Word(ParsingElement):
 #
 # -----------------------------------------------------------------------------
 
+class _TokenConfig(object):
+	"""Holds a C token configuration retained with `Token_retain`, which is
+	released when the holder is garbage collected."""
+
+	__slots__ = ("cobject", "__weakref__")
+
+	def __init__( self, token ):
+		self.cobject = ffi.gc(lib.Token_retain(token), lib.Token_release)
+
+# The retained C token configurations, by expression. The tokens created
+# from a configuration keep its holder alive, so that configurations are
+# released once no `Token` wrapper uses them anymore.
+_TOKEN_CACHE = weakref.WeakValueDictionary()
+
 class Token(ParsingElement):
 
-	def _new( self, token):
-		self._token = ensure_bytes(token)
-		return lib.Token_new(self._token)
+	__slots__ = ("_token", "_config")
+
+	def _new( self, token, name=None ):
+		self._token  = ensure_bytes(token)
+		self._name   = None if name is None else ensure_bytes(name)
+		self._config = _TOKEN_CACHE.get(self._token)
+		if self._config is not None:
+			return lib.Token_newShared(self._config.cobject, self._name or ffi.NULL)
+		if self._name is None:
+			t = lib.Token_new(self._token)
+		else:
+			t = lib.Token_newNamed(self._name, self._token)
+		if t and HAS_TOKEN_SHARED:
+			self._config = _TOKEN_CACHE[self._token] = _TokenConfig(t)
+		return t
 
 # -----------------------------------------------------------------------------
 #
@@ -372,8 +560,15 @@ class Token(ParsingElement):
 
 class Group(ParsingElement):
 
-	def _new( self, *children ):
-		self._cobject = lib.Group_new(ffi.NULL)
+	__slots__ = ()
+
+	def _new( self, *children, **options ):
+		name = options.get("name")
+		if name is None:
+			self._cobject = lib.Group_new(ffi.NULL)
+		else:
+			self._name    = ensure_bytes(name)
+			self._cobject = lib.Group_newNamed(self._name, ffi.NULL)
 		self.add(*children)
 
 # -----------------------------------------------------------------------------
@@ -384,8 +579,15 @@ class Group(ParsingElement):
 
 class Rule(ParsingElement):
 
-	def _new( self, *children ):
-		self._cobject = lib.Rule_new(ffi.NULL)
+	__slots__ = ()
+
+	def _new( self, *children, **options ):
+		name = options.get("name")
+		if name is None:
+			self._cobject = lib.Rule_new(ffi.NULL)
+		else:
+			self._name    = ensure_bytes(name)
+			self._cobject = lib.Rule_newNamed(self._name, ffi.NULL)
 		self.add(*children)
 
 # -----------------------------------------------------------------------------
@@ -394,8 +596,18 @@ class Rule(ParsingElement):
 #
 # -----------------------------------------------------------------------------
 
+# The condition and procedure wrappers, by C element address. They hold the
+# C callbacks, which must live as long as the C elements, until the grammar
+# using them claims them (see `Grammar.prepare`).
+# NOTE: The wrappers are not kept by their parents, as recursive grammars
+# would then create reference cycles of wrappers with a `__del__`, which
+# Python 2 cannot collect.
+_CALLBACKS = {}
+
 class Condition(ParsingElement):
 
+	__slots__ = ("_callback", "_function")
+
 	@classmethod
 	def WrapCallback(cls, callback):
 		# SEE: http://stackoverflow.com/questions/34392109/use-extern-python-style-cffi-callbacks-with-embedded-pypy
@@ -406,8 +618,13 @@ class Condition(ParsingElement):
 		return c
 
 	def _new( self, callback ):
-		self._callback = (self.WrapCallback(callback), callback)
-		return lib.Condition_new(self._callback[0])
+		# NOTE: The C callback must live as long as the C condition, which
+		# is ensured by `_CALLBACKS` and then the grammar keeping this wrapper.
+		self._function = callback
+		self._callback = self.WrapCallback(callback)
+		c = lib.Condition_new(self._callback)
+		_CALLBACKS[_address(c)] = self
+		return c
 
 # -----------------------------------------------------------------------------
 #
@@ -417,6 +634,8 @@ class Condition(ParsingElement):
 
 class Procedure(ParsingElement):
 
+	__slots__ = ("_callback", "_function")
+
 	@classmethod
 	def WrapCallback(cls, callback):
 		def c(e,ctx):
@@ -426,8 +645,12 @@ class Procedure(ParsingElement):
 		return c
 
 	def _new( self, callback ):
-		self._callback = (self.WrapCallback(callback), callback)
-		return lib.Procedure_new(self._callback[0])
+		# NOTE: See `Condition._new`
+		self._function = callback
+		self._callback = self.WrapCallback(callback)
+		p = lib.Procedure_new(self._callback)
+		_CALLBACKS[_address(p)] = self
+		return p
 
 # -----------------------------------------------------------------------------
 #
@@ -437,10 +660,15 @@ class Procedure(ParsingElement):
 
 class Reference(CObject):
 
+	__slots__ = ("_element", "_name", "_nameCache")
+
 	@classmethod
 	def IsCType( self, element ):
 		return isinstance(element, FFI.CData) and lib.Reference_Is(element)
 
+	def _init( self ):
+		self._nameCache = NOTHING
+
 	def _new( self, element ):
 		assert isinstance(element, ParsingElement)
 		assert element._cobject
@@ -455,7 +683,11 @@ class Reference(CObject):
 
 	@property
 	def name( self ):
-		return ensure_str(ffi.string(self._cobject.name)) if self._cobject.name != ffi.NULL else None
+		# NOTE: Names are cached, as they are only changed through `_as`
+		if self._nameCache is NOTHING:
+			name = self._cobject.name
+			self._nameCache = ensure_str(_ffi_string(name)) if name != ffi.NULL else None
+		return self._nameCache
 
 	@property
 	def id( self ):
@@ -474,28 +706,29 @@ class Reference(CObject):
 	# =========================================================================
 
 	def _as( self, name ):
-		self._name = ensure_bytes(name)
+		self._name      = ensure_bytes(name)
+		self._nameCache = NOTHING
 		lib.Reference_name(self._cobject, self._name)
 		return self
 
 	def one( self ):
-		lib.Reference_cardinality(self._cobject, CARDINALITY_ONE)
+		_lib_Reference_cardinality(self._cobject, CARDINALITY_ONE)
 		return self
 
 	def optional( self ):
-		lib.Reference_cardinality(self._cobject, CARDINALITY_OPTIONAL)
+		_lib_Reference_cardinality(self._cobject, CARDINALITY_OPTIONAL)
 		return self
 
 	def zeroOrMore( self ):
-		lib.Reference_cardinality(self._cobject, CARDINALITY_MANY_OPTIONAL)
+		_lib_Reference_cardinality(self._cobject, CARDINALITY_MANY_OPTIONAL)
 		return self
 
 	def oneOrMore( self ):
-		lib.Reference_cardinality(self._cobject, CARDINALITY_MANY)
+		_lib_Reference_cardinality(self._cobject, CARDINALITY_MANY)
 		return self
 
 	def notEmpty( self ):
-		lib.Reference_cardinality(self._cobject, CARDINALITY_NOT_EMPTY)
+		_lib_Reference_cardinality(self._cobject, CARDINALITY_NOT_EMPTY)
 		return self
 
 	# =========================================================================
@@ -537,6 +770,9 @@ class Reference(CObject):
 		# them directly, so we don't need to free them either.
 		pass
 
+# The types that can be added as children of a parsing element.
+_ELEMENT_TYPES = (ParsingElement, Reference)
+
 # -----------------------------------------------------------------------------
 #
 # MATCH
@@ -545,13 +781,15 @@ class Reference(CObject):
 
 class Match(CObject):
 
+	__slots__ = ()
+
 	_TYPE       = ffi.typeof("Match*")
 	_RECYCLABLE = False
 
 	@classmethod
 	def Wrap( cls, cobject ):
 		assert cobject.element != ffi.NULL, "Match C object does not have an element: %s %d+%d" % (cobject.status, cobject.offset, cobject.length)
-		return cls.Reuse(cobject) or Match(cobject, wrap=cls._TYPE)
+		return super(Match, cls).Wrap(cobject)
 
 	def _new( self, o ):
 		return ffi.cast(self._TYPE, o)
@@ -579,7 +817,7 @@ class Match(CObject):
 	@property
 	def name( self ):
 		name = lib.Match_getElementName(self._cobject)
-		return ensure_str(ffi.string(name)) if name else None
+		return ensure_str(_ffi_string(name)) if name else None
 
 	@property
 	def id( self ):
@@ -624,6 +862,36 @@ class Match(CObject):
 		os.unlink(fn)
 		return text
 
+	def walk( self, callback ):
+		"""Walks this match and its descendants depth-first, invoking
+		`callback(match, step)` for each of them. The walk stops as soon
+		as the callback returns a negative value. Returns the last step."""
+		if not HAS_COLLECT:
+			return self._walkCallback(callback)
+		matches, count = _collect(lib.Match__collect, self._cobject)
+		wrap = Match.Wrap
+		cast = _ffi_cast
+		t    = self._TYPE
+		step = 0
+		try:
+			for step in range(count):
+				r = callback(wrap(cast(t, matches[step])), step)
+				if r is not None and r < 0:
+					break
+		finally:
+			_release("void*[]", matches)
+		return step
+
+	def _walkCallback( self, callback ):
+		"""The fallback implementation of `walk`, using a C callback. As
+		`Match__walk` also walks the next siblings, only the children are
+		walked through it."""
+		r = callback(self, 0)
+		children = self._cobject.children
+		if (r is not None and r < 0) or not children:
+			return 0
+		return _walk("match", callback, lambda: lib.Match__walk(children, _matchWalkingCallback, 1, ffi.NULL))
+
 	def toJSON( self ):
 		return self._toHelper(lib.Match_writeJSON)
 
@@ -740,14 +1008,53 @@ class MatchResult(object):
 #
 # -----------------------------------------------------------------------------
 
-class Symbols:
+class Symbols(object):
+	"""The symbols defined in a grammar, available both as items and
+	attributes, stored in a dictionary."""
+
+	__slots__ = ("_d",)
+
+	def __init__( self ):
+		object.__setattr__(self, "_d", {})
 
 	def __setitem__( self, key, value ):
-		setattr(self, key, value)
+		self._d[key] = value
 		return value
 
 	def __getitem__( self, key ):
-		return getattr(self, key)
+		# NOTE: Unknown symbols raise an `AttributeError`, as symbols used
+		# to be stored as attributes.
+		try:
+			return self._d[key]
+		except KeyError:
+			raise AttributeError(key)
+
+	def __setattr__( self, key, value ):
+		if key == "_d":
+			object.__setattr__(self, key, value)
+		else:
+			self._d[key] = value
+
+	def __getattr__( self, key ):
+		# NOTE: We guard against `_d` not being set yet, which would
+		# otherwise recurse.
+		if key == "_d": raise AttributeError(key)
+		try:
+			return self._d[key]
+		except KeyError:
+			raise AttributeError(key)
+
+	def __contains__( self, key ):
+		return key in self._d
+
+	def __iter__( self ):
+		return iter(self._d)
+
+	# NOTE: This is private, as the public attributes are the symbols.
+	def _update( self, symbols ):
+		"""Defines all the symbols in the given dictionary at once."""
+		self._d.update(symbols)
+		return self
 
 # -----------------------------------------------------------------------------
 #
@@ -757,6 +1064,8 @@ class Symbols:
 
 class ParsingContext(CObject):
 
+	__slots__ = ()
+
 	_TYPE = ffi.typeof("ParsingContext*")
 
 	@property
@@ -800,6 +1109,8 @@ class ParsingContext(CObject):
 
 class ParsingResult(CObject):
 
+	__slots__ = ("_text", "_path", "_grammar", "_context")
+
 	_TYPE = ffi.typeof("ParsingResult*")
 
 	@classmethod
@@ -990,6 +1301,8 @@ class ParsingResult(CObject):
 
 class ParsingStats(CObject):
 
+	__slots__ = ()
+
 	def bytesRead( self ):
 		return self._cobject.bytesRead
 
@@ -1059,6 +1372,10 @@ class ParsingStats(CObject):
 
 class Grammar(CObject):
 
+	# NOTE: Grammars keep a `__dict__`, as they are few and client code
+	# assigns arbitrary attributes to them (such as `isVerbose`).
+	__slots__ = ("name", "symbols", "_prepared", "_anonymous", "_callbacks", "__dict__")
+
 	_TYPE = ffi.typeof("Grammar*")
 
 	def _new(self, name=None, isVerbose=False ):
@@ -1068,6 +1385,7 @@ class Grammar(CObject):
 		g.isVerbose = 1 if isVerbose else 0
 		self._prepared  = False
 		self._anonymous = []
+		self._callbacks = []
 		return g
 
 	# =========================================================================
@@ -1096,7 +1414,7 @@ class Grammar(CObject):
 	def axiom( self, axiom ):
 		self._prepared = False
 		if isinstance(axiom, Reference):
-			axiom = axiom._cobject.element
+			axiom = axiom.element
 			assert axiom
 		assert isinstance(axiom, ParsingElement)
 		self._cobject.axiom = axiom._cobject
@@ -1119,8 +1437,7 @@ class Grammar(CObject):
 
 	def word( self, name, word):
 		self._prepared = False
-		r = Word(word)
-		r.name = name
+		r = Word(word, name=name)
 		self.symbols[name] = r
 		return r
 
@@ -1130,8 +1447,7 @@ class Grammar(CObject):
 
 	def token( self, name, token):
 		self._prepared = False
-		r = Token(token)
-		r.name = name
+		r = Token(token, name=name)
 		self.symbols[name] = r
 		return r
 
@@ -1163,8 +1479,7 @@ class Grammar(CObject):
 
 	def group( self, name, *children):
 		self._prepared = False
-		r = Group(*children)
-		r.name = name
+		r = Group(*children, name=name)
 		self.symbols[name] = r
 		return r
 
@@ -1174,8 +1489,7 @@ class Grammar(CObject):
 
 	def rule( self, name, *children):
 		self._prepared = False
-		r = Rule(*children)
-		r.name = name
+		r = Rule(*children, name=name)
 		self.symbols[name] = r
 		return r
 
@@ -1183,6 +1497,41 @@ class Grammar(CObject):
 		self._prepared = False
 		return self._registerAnonymous(Rule(*children))
 
+	def define( self, *definitions ):
+		"""Defines the given symbols at once, where each definition is a
+		`(kind, name, spec)` triple. The `kind` is one of `word`, `token`,
+		`group`, `rule`, `condition` or `procedure`, and the `spec` is
+		respectively the word, the token expression, the list of children or
+		the callback. Returns the list of defined elements."""
+		# NOTE: We check all the kinds first, so that an invalid definition
+		# does not leave the grammar with only some of the elements created.
+		definitions = list(definitions)
+		for kind, name, spec in definitions:
+			if kind not in ("word", "token", "group", "rule", "condition", "procedure"):
+				raise Exception("Unknown symbol kind {0} for {1}, options are word, token, group, rule, condition or procedure".format(kind, name))
+		self._prepared = False
+		defined = {}
+		res     = []
+		for kind, name, spec in definitions:
+			if kind == "word":
+				r = Word(spec, name=name)
+			elif kind == "token":
+				r = Token(spec, name=name)
+			elif kind == "group":
+				r = Group(*spec, name=name)
+			elif kind == "rule":
+				r = Rule(*spec, name=name)
+			elif kind == "condition":
+				r = Condition(spec)
+				r.name = name
+			else:
+				r = Procedure(spec)
+				r.name = name
+			defined[name] = r
+			res.append(r)
+		self.symbols._update(defined)
+		return res
+
 	def _registerAnonymous( self, element ):
 		"""Forces the grammar to keep references to anonymous symbols it
 		created."""
@@ -1212,15 +1561,82 @@ class Grammar(CObject):
 			else:
 				return ParsingElement.Wrap(e)
 		else:
-			return getattr(self.symbols, id)
+			return self.symbols[id]
+
+	def walk( self, callback ):
+		"""Walks the elements reachable from the axiom in the order in which
+		they were assigned their ids, invoking `callback(element, step)` for
+		each of them, where `element` is either a `Reference` or a
+		`ParsingElement`. The walk stops as soon as the callback returns
+		a negative value. Returns the last step."""
+		self._prepare()
+		axiom = ffi.cast("Element*", self._cobject.axiom)
+		if not HAS_COLLECT:
+			return self._walkCallback(callback, axiom)
+		elements, count = _collect(lib.Element__collect, axiom)
+		is_reference = _lib_Reference_Is
+		is_element   = lib.ParsingElement_Is
+		step = 0
+		try:
+			for i in range(count):
+				e = elements[i]
+				if is_reference(e):
+					e = Reference.Wrap(e)
+				elif is_element(e):
+					e = ParsingElement.Wrap(e)
+				else:
+					continue
+				step = e.id
+				r    = callback(e, step)
+				if r is not None and r < 0:
+					break
+		finally:
+			_release("void*[]", elements)
+		return step
+
+	def tree( self, depth=-1 ):
+		"""Returns the elements reachable from the axiom as `(depth, element)`
+		couples, in the same order as `walk`, only including the elements
+		that are at most `depth` deep (all of them when negative)."""
+		self._prepare()
+		axiom    = ffi.cast("Element*", self._cobject.axiom)
+		capacity = WALK_CAPACITY
+		while True:
+			elements = _acquire("void*[]", capacity)
+			depths   = _acquire("int[]",   capacity)
+			count    = lib.Element__walkBounded(axiom, depth, elements, depths, capacity)
+			if count <= capacity: break
+			_release("void*[]", elements)
+			_release("int[]",   depths)
+			capacity = count
+		is_reference = _lib_Reference_Is
+		res = []
+		try:
+			for i in range(count):
+				e = elements[i]
+				w = Reference.Wrap(e) if is_reference(e) else ParsingElement.Wrap(e)
+				res.append((depths[i], w))
+		finally:
+			_release("void*[]", elements)
+			_release("int[]",   depths)
+		return res
+
+	def dump( self, depth=-1, output=sys.stdout ):
+		"""Writes the tree of elements reachable from the axiom to the given
+		output, which is useful for debugging grammars."""
+		# NOTE: The lines are written at once, as writing them one by one
+		# is slow for large grammars.
+		lines = ["{0}{1}\n".format("    " * d, e) for d, e in self.tree(depth)]
+		output.write("".join(lines))
+		return self
+
+	def _walkCallback( self, callback, axiom ):
+		"""The fallback implementation of `walk`, using a C callback."""
+		return _walk("element", callback, lambda: lib.Element_walk(axiom, _elementWalkingCallback, ffi.NULL))
 
 	def list( self ):
 		"""Lists the symbols defined in the grammar."""
-		res = []
-		for k in dir(self.symbols):
-			if k.startswith("__"): continue
-			res.append((k, getattr(self.symbols, k)))
-		return res
+		return [(k, self.symbols[k]) for k in sorted(self.symbols)]
 
 	def _prepare( self ):
 		"""Ensures the grammar is prepared."""
@@ -1230,12 +1646,46 @@ class Grammar(CObject):
 	def prepare( self ):
 		lib.Grammar_prepare(self._cobject)
 		self._prepared = True
+		if _CALLBACKS: self._claim()
+
+	def _claim( self ):
+		"""Moves the condition and procedure wrappers of the grammar's elements
+		from `_CALLBACKS` to the grammar, so that their C callbacks are
+		released along with the grammar."""
+		g = self._cobject
+		if not g.elements: return
+		for i in range(g.axiomCount + g.skipCount + 1):
+			e = g.elements[i]
+			if e:
+				w = _CALLBACKS.pop(_address(e), None)
+				if w is not None: self._callbacks.append(w)
+
+	def _evict( self ):
+		"""Removes the wrappers of the elements that are freed along with the
+		grammar from the wrapper cache and detaches them from their C
+		objects, so that they're not returned for new C objects allocated at
+		the same addresses."""
+		g = self._cobject
+		# NOTE: This mirrors `Grammar_freeElements`, which only prepares the
+		# grammar when it has no elements yet.
+		if not g.elements: lib.Grammar_prepare(g)
+		if not g.elements: return
+		cache = CObject._CACHE
+		for i in range(g.axiomCount + g.skipCount + 1):
+			e = g.elements[i]
+			if e:
+				a = _address(e)
+				_CALLBACKS.pop(a, None)
+				w = cache.pop(a, None)
+				if w is not None: w._cobject = None
 
 	def __del__( self ):
 		super(self.__class__, self).__del__()
 		# The parsing result is the only one we really need to free
 		# along with the grammar
-		lib.Grammar_free(self._cobject)
+		if self._cobject:
+			self._evict()
+			lib.Grammar_free(self._cobject)
 
 # -----------------------------------------------------------------------------
 #
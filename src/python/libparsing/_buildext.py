@@ -8,12 +8,14 @@ module.
 
 NAME       = "_libparsing"
 BASE       = dirname(abspath(__file__))
-H_SOURCE   = open(join(BASE,NAME + ".h")).read()
-C_SOURCE   = open(join(BASE,NAME + ".c")).read()
-FFI_SOURCE = open(join(BASE,NAME + ".ffi")).read()
 PY_VERSION = "{0}_{1}_{2}".format(sys.version_info.major, sys.version_info.minor, sys.version.rsplit("[", 1)[-1].split()[0].lower())
 FFI_BUILDER = None
 
+def source(ext):
+	"""Returns the content of the `_libparsing.{ext}` source file"""
+	with open(join(BASE, NAME + "." + ext)) as f:
+		return f.read()
+
 def name():
 	"""Returns the name of the Python module to be built"""
 	return "{0}py{1}".format(NAME, PY_VERSION)
@@ -23,22 +25,27 @@ def filename(ext):
 	return "{0}py{1}.{2}".format(NAME, PY_VERSION, ext)
 
 def builder():
+	"""Returns the CFFI builder for the extension. The builder is only created
+	when first requested, as parsing the FFI interface is slow and is not
+	needed when the extension is already built."""
+	global FFI_BUILDER
 	# In order to avoid _libparsing.so: undefined symbol: PyInt_FromLong
 	# SEE: http://community.activestate.com/node/9069
 	# SEE: http://cffi.readthedocs.io/en/latest/embedding.html
 	if FFI_BUILDER: return FFI_BUILDER
 	ffibuilder = cffi.FFI()
 	ffibuilder.set_source(
-		"{0}".format(name()), H_SOURCE + C_SOURCE,
+		"{0}".format(name()), source("h") + source("c"),
 		extra_link_args=["-Wl,-lpcre,-Ofast,--export-dynamic"]
 	)
-	ffibuilder.cdef(FFI_SOURCE)
+	ffibuilder.cdef(source("ffi"))
 	ffibuilder.embedding_init_code("""
 	from {0} import ffi
 	@ffi.def_extern()
 	def module_init():
 		pass
 	""".format(name()))
+	FFI_BUILDER = ffibuilder
 	return ffibuilder
 
 def build(path=BASE):
@@ -58,7 +65,6 @@ def build(path=BASE):
 	os.rmdir(build_path)
 	return dest
 
-FFI_BUILDER = builder ()
 if __name__ == "__main__":
 	args = sys.argv[1:]
 	build ()
@@ -172,6 +172,12 @@ int Element_walk( Element* this, ElementWalkingCallback callback, void* context)
 
 
 int Element__walk( Element* this, ElementWalkingCallback callback, int step, void* context);
+
+
+int Element__collect( Element* this, void** out, int capacity );
+
+
+int Element__walkBounded( Element* this, int maxDepth, void** out, int* depths, int capacity );
 typedef struct Match {
 
  char status;
@@ -184,6 +190,7 @@ typedef struct Match {
  struct Match* children;
  struct Match* parent;
  void* result;
+ struct MatchArena* arena;
 } Match;
 typedef int (*MatchWalkingCallback)(Match* this, int step, void* context);
 
@@ -270,6 +277,9 @@ const char* Match_getElementName(Match* this);
 int Match__walk(Match* this, MatchWalkingCallback callback, int step, void* context );
 
 
+int Match__collect(Match* this, void** out, int capacity);
+
+
 int Match_countAll(Match* this);
 
 
@@ -296,6 +306,10 @@ void Match_writeXML(Match* this, int fd);
 void Match_printXML(Match* this);
 
 
+
+
+
+
 typedef struct ParsingElement {
  char type;
  int id;
@@ -368,6 +382,11 @@ typedef struct WordConfig {
 ParsingElement* Word_new(const char* word);
 
 
+
+
+ParsingElement* Word_newNamed(const char* name, const char* word);
+
+
 void Word_free(ParsingElement* this);
 
 
@@ -381,6 +400,7 @@ const char* Word_word(ParsingElement* this);
 const char* WordMatch_group(Match* match);
 typedef struct TokenConfig {
  char* expr;
+ int refs;
 
  pcre* regexp;
  pcre_extra* extra;
@@ -399,10 +419,32 @@ typedef struct TokenMatch {
 ParsingElement* Token_new(const char* expr);
 
 
+
+
+ParsingElement* Token_newNamed(const char* name, const char* expr);
+
+
+
+
+
+ParsingElement* Token_newShared(void* config, const char* name);
+
+
 void Token_free(ParsingElement*);
 
 
 
+
+
+void* Token_retain(ParsingElement* this);
+
+
+
+
+void Token_release(void* config);
+
+
+
 Match* Token_recognize(ParsingElement* this, ParsingContext* context);
 
 
@@ -485,10 +527,16 @@ Match* Reference_recognize(Reference* this, ParsingContext* context);
 ParsingElement* Group_new(Reference* children[]);
 
 
+ParsingElement* Group_newNamed(const char* name, Reference* children[]);
+
+
 Match* Group_recognize(ParsingElement* this, ParsingContext* context);
 ParsingElement* Rule_new(Reference* children[]);
 
 
+ParsingElement* Rule_newNamed(const char* name, Reference* children[]);
+
+
 Match* Rule_recognize(ParsingElement* this, ParsingContext* context);
 typedef void (*ProcedureCallback)(ParsingElement* this, ParsingContext* context);
 
@@ -590,6 +638,7 @@ typedef struct ParsingContext {
  
 _Bool 
                         freeIterator;
+ struct MatchArena* matches;
 } ParsingContext;
 
 
@@ -782,6 +831,45 @@ Match* FAILURE = &FAILURE_S;
 
 
 
+
+
+
+
+
+typedef struct MatchBlock {
+ struct MatchBlock* next;
+ size_t used;
+ Match matches[1024];
+} MatchBlock;
+
+
+
+
+typedef struct MatchArena {
+ MatchBlock* blocks;
+ Match* recycled;
+} MatchArena;
+
+
+MatchArena* MatchArena_new(void);
+
+
+void MatchArena_free(MatchArena* this);
+
+
+
+Match* MatchArena_alloc(MatchArena* this);
+
+
+
+void MatchArena_recycle(MatchArena* this, Match* match);
+
+
+
+
+
+
+
 const char* EMPTY = "";
 const char* INDENT = "                                                                                ";
 char* String_escape(const char* string) {
@@ -1211,7 +1299,8 @@ void Grammar_free(Grammar* this) {
 
 
 Match* Match__Success(size_t length, Element* element, ParsingContext* context) {
- Match* this = Match_new();
+
+ Match* this = context->matches != NULL ? MatchArena_alloc(context->matches) : Match_new();
  assert( element != NULL );
  this->status = 'M';
  this->offset = context->iterator->offset;
@@ -1223,6 +1312,8 @@ Match* Match__Success(size_t length, Element* element, ParsingContext* context)
  this->next = NULL;
  this->children = NULL;
  this->parent = NULL;
+ this->result = NULL;
+ this->arena = context->matches;
  return this;
 }
 
@@ -1247,6 +1338,7 @@ Match* Match_new(void) {
  this->children = NULL;
  this->parent = NULL;
  this->result = NULL;
+ this->arena = NULL;
  return this;
 }
 
@@ -1285,7 +1377,12 @@ void* Match_free(Match* this) {
 
   }
 
-  if (this!=NULL) {; gc_free(this); } ;
+
+  if (this->arena != NULL) {
+   MatchArena_recycle(this->arena, this);
+  } else {
+   if (this!=NULL) {; gc_free(this); } ;
+  }
  }
  return NULL;
 }
@@ -1357,13 +1454,30 @@ _Bool
 }
 
 int Match__walk(Match* this, MatchWalkingCallback callback, int step, void* context ){
- step = callback(this, step, context);
- if (this->children != NULL && step >= 0) {
-  step = Match__walk(this->children, callback, step + 1, context);
- }
- if (this->next != NULL && step >= 0) {
-  step = Match__walk(this->next, callback, step + 1, context);
+ int capacity = 64;
+ int top      = 0;
+ Match** stack = (Match**) gc_calloc(capacity, sizeof(Match*)) ; assert (stack!=NULL); ;
+ Match* match = this;
+ while (match != NULL) {
+  step = callback(match, step, context);
+  if (step < 0) {break;}
+  if (match->children != NULL) {
+   if (match->next != NULL) {
+    if (top == capacity) {
+     capacity = capacity * 2;
+     stack=gc_realloc(stack,capacity * sizeof(Match*)); ;
+    }
+    stack[top++] = match->next;
+   }
+   match = match->children;
+  } else if (match->next != NULL) {
+   match = match->next;
+  } else {
+   match = top > 0 ? stack[--top] : NULL;
+  }
+  step += match != NULL ? 1 : 0;
  }
+ if (stack!=NULL) {; gc_free(stack); } ;
  return step;
 }
 
@@ -1396,6 +1510,34 @@ int Match_countAll(Match* this) {
  return Match__walk(this, Match__walkCounter, 0, NULL);
 }
 
+
+
+typedef struct Collector {
+ void** out;
+ int* depths;
+ int capacity;
+ int count;
+ int maxDepth;
+} Collector;
+
+int Match__collectCallback (Match* this, int step, void* context) {
+ Collector* c = (Collector*)context;
+ if (c->count < c->capacity) {c->out[c->count] = this;}
+ c->count++;
+ return step;
+}
+
+int Match__collect(Match* this, void** out, int capacity) {
+ Collector c = {out, NULL, capacity, 0, -1};
+
+
+ if (this != NULL) {
+  Match__collectCallback(this, 0, &c);
+  if (this->children != NULL) {Match__walk(this->children, Match__collectCallback, 1, &c);}
+ }
+ return c.count;
+}
+
 int Match_countChildren(Match* this) {
  int count = 0;
  Match* child = this->children;
@@ -1405,6 +1547,49 @@ int Match_countChildren(Match* this) {
  }
  return count;
 }
+
+MatchArena* MatchArena_new(void) {
+ MatchArena* this = (MatchArena*) gc_new(sizeof(MatchArena)); assert (this!=NULL); ;
+ this->blocks = NULL;
+ this->recycled = NULL;
+ return this;
+}
+
+void MatchArena_free(MatchArena* this) {
+ if (this != NULL) {
+  MatchBlock* block = this->blocks;
+  while (block != NULL) {
+   MatchBlock* next = block->next;
+   if (block!=NULL) {; gc_free(block); } ;
+   block = next;
+  }
+ }
+ if (this!=NULL) {; gc_free(this); } ;
+}
+
+Match* MatchArena_alloc(MatchArena* this) {
+ Match* match = this->recycled;
+ if (match != NULL) {
+  this->recycled = match->next;
+ } else {
+  if (this->blocks == NULL || this->blocks->used == 1024) {
+   MatchBlock* block = (MatchBlock*) gc_new(sizeof(MatchBlock)); assert (block!=NULL); ;
+   block->next = this->blocks;
+   block->used = 0;
+   this->blocks = block;
+  }
+  match = &(this->blocks->matches[this->blocks->used++]);
+ }
+ return match;
+}
+
+void MatchArena_recycle(MatchArena* this, Match* match) {
+ match->next = this->recycled;
+ this->recycled = match;
+}
+
+
+
 void Match__childrenWriteJSON(Match* match, int fd, int flags) {
  int count = 0 ;
  Match* child = match->children;
@@ -1794,45 +1979,142 @@ int ParsingElement_walk( ParsingElement* this, ElementWalkingCallback callback,
 
 int ParsingElement__walk( ParsingElement* this, ElementWalkingCallback callback, int step, void* context ) {
  ;;
- int i = step;
- step = callback((Element*)this, step, context);
- Reference* child = this->children;
- while ( child != NULL && step >= 0) {
+ return Element__walk((Element*)this, callback, step, context);
+}
 
 
-  assert(Reference_Is(child));
-  int j = Reference__walk(child, callback, ++i, context);
 
-  if (j > 0) { step = i = j; }
-  else {break;}
-  child = child->next;
+
+
+
+
+int Element_walk( Element* this, ElementWalkingCallback callback, void* context ) {
+ return Element__walk(this, callback, 0, context);
+}
+
+
+
+typedef struct ElementWalkFrame {
+ ParsingElement* element;
+ Reference*      child;
+ int             i;
+ int             step;
+ int             depth;
+} ElementWalkFrame;
+
+
+_Bool 
+    Element__walkBoundedVisit( Element* this, int step, int depth, Collector* c ) {
+
+
+ if (step > this->id) {return 0;}
+ if (c->maxDepth < 0 || depth <= c->maxDepth) {
+  if (c->count < c->capacity) {
+   c->out[c->count] = this;
+   if (c->depths != NULL) {c->depths[c->count] = depth;}
+  }
+  c->count++;
  }
- return (step > 0) ? step : i;
+ return 1;
 }
 
+int Element__walkVisit( Element* this, int step, int depth, ElementWalkingCallback callback, void* context ) {
+ if (callback != NULL) {return callback(this, step, context);}
+ return Element__walkBoundedVisit(this, step, depth, (Collector*)context) ? step : -1;
+}
 
 
 
 
 
 
-int Element_walk( Element* this, ElementWalkingCallback callback, void* context ) {
- return Element__walk(this, callback, 0, context);
+
+
+int Element__walkFrames( Element* this, ElementWalkingCallback callback, int step, void* context ) {
+ if (this == NULL) {return step;}
+ ParsingElement* element = NULL;
+ int depth = 0;
+ if (Reference_Is(this)) {
+  step = Element__walkVisit(this, step, depth, callback, context);
+  if (step < 0) {return step;}
+  assert(!Reference_Is(((Reference*)this)->element));
+  element = ((Reference*)this)->element;
+  step    = step + 1;
+  depth   = 1;
+ } else if (ParsingElement_Is(this)) {
+  element = (ParsingElement*)this;
+ } else {
+  assert(0);
+  return step;
+ }
+ int capacity = 64;
+ int top      = -1;
+ int result   = step;
+ ElementWalkFrame* stack = (ElementWalkFrame*) gc_calloc(capacity, sizeof(ElementWalkFrame)) ; assert (stack!=NULL); ;
+ while (1) {
+  ElementWalkFrame* frame = NULL;
+  if (element != NULL) {
+
+   if (top + 1 == capacity) {
+    capacity = capacity * 2;
+    stack=gc_realloc(stack,capacity * sizeof(ElementWalkFrame)); ;
+   }
+   frame = &stack[++top];
+   frame->element = element;
+   frame->i       = step;
+   frame->step    = Element__walkVisit((Element*)element, step, depth, callback, context);
+   frame->child   = frame->step >= 0 ? element->children : NULL;
+   frame->depth   = depth;
+   element        = NULL;
+  }
+  frame = &stack[top];
+  if (frame->child != NULL) {
+
+   Reference* child = frame->child;
+   assert(Reference_Is(child));
+   result = Element__walkVisit((Element*)child, ++frame->i, frame->depth + 1, callback, context);
+   if (result >= 0) {
+
+
+    assert(!Reference_Is(child->element));
+    element = child->element;
+    step    = result + 1;
+    depth   = frame->depth + 2;
+    continue;
+   }
+  } else {
+
+
+   result = (frame->step > 0) ? frame->step : frame->i;
+   if (top == 0) {break;}
+   frame = &stack[--top];
+  }
+
+  if (result > 0) {
+   frame->step  = frame->i = result;
+   frame->child = frame->child->next;
+  } else {
+   frame->child = NULL;
+  }
+ }
+ if (stack!=NULL) {; gc_free(stack); } ;
+ return result;
 }
 
 int Element__walk( Element* this, ElementWalkingCallback callback, int step, void* context ) {
  assert (callback != NULL);
  ;;
- if (this!=NULL) {
-  if (Reference_Is(this)) {
-   step = Reference__walk((Reference*)this, callback, step, context);
-  } else if (ParsingElement_Is(this)) {
-   step = ParsingElement__walk((ParsingElement*)this, callback, step, context);
-  } else {
-   assert(0);
-  }
- }
- return step;
+ return Element__walkFrames(this, callback, step, context);
+}
+
+int Element__walkBounded( Element* this, int maxDepth, void** out, int* depths, int capacity ) {
+ Collector c = {out, depths, capacity, 0, maxDepth};
+ Element__walkFrames(this, NULL, 0, &c);
+ return c.count;
+}
+
+int Element__collect( Element* this, void** out, int capacity ) {
+ return Element__walkBounded(this, -1, out, NULL, capacity);
 }
 
 
@@ -1925,12 +2207,7 @@ Reference* Reference_name(Reference* this, const char* name) {
 
 int Reference__walk( Reference* this, ElementWalkingCallback callback, int step, void* context ) {
  ;;
- step = callback((Element*)this, step, context);
- if (step >= 0) {
-  assert(!Reference_Is(this->element));
-  step = ParsingElement__walk(this->element, callback, step + 1, context);
- }
- return step;
+ return Element__walk((Element*)this, callback, step, context);
 }
 
 Match* Reference_recognize(Reference* this, ParsingContext* context) {
@@ -2103,6 +2380,10 @@ ParsingElement* Word_new(const char* word) {
  return this;
 }
 
+ParsingElement* Word_newNamed(const char* name, const char* word) {
+ return ParsingElement_name(Word_new(word), name);
+}
+
 
 void Word_free(ParsingElement* this) {
 
@@ -2181,26 +2462,52 @@ ParsingElement* Token_new(const char* expr) {
   return NULL;
  }
 
+ config->refs = 1;
  this->config = config;
  assert(strcmp(config->expr, expr) == 0);
  assert(strcmp(Token_expr(this), expr) == 0);
  return this;
 }
 
+ParsingElement* Token_newNamed(const char* name, const char* expr) {
+ return ParsingElement_name(Token_new(expr), name);
+}
+
+ParsingElement* Token_newShared(void* config, const char* name) {
+ assert(config != NULL);
+ ParsingElement* this = ParsingElement_new(NULL);
+ this->type = 'T';
+ this->recognize = Token_recognize;
+ this->freeMatch = TokenMatch_free;
+ this->config = config;
+ ((TokenConfig*)config)->refs++;
+ if (name != NULL) {ParsingElement_name(this, name);}
+ return this;
+}
 
 void Token_free(ParsingElement* this) {
+ Token_release(this->config);
+ if (this!=NULL) {if (this->name!=NULL) {; gc_free(this->name); } };
+ if (this!=NULL) {; gc_free(this); } ;
+}
+
+void* Token_retain(ParsingElement* this) {
  TokenConfig* config = (TokenConfig*)this->config;
- if (config != NULL) {
+ config->refs++;
+ return config;
+}
 
+void Token_release(void* config) {
+ TokenConfig* this = (TokenConfig*)config;
+ if (this != NULL && --this->refs <= 0) {
 
-  if (config->regexp != NULL) {pcre_free(config->regexp);}
-  if (config->extra != NULL) {pcre_free_study(config->extra);}
 
-  if (config->expr!=NULL) {; gc_free(config->expr); } ;
-  if (config!=NULL) {; gc_free(config); } ;
+  if (this->regexp != NULL) {pcre_free(this->regexp);}
+  if (this->extra != NULL) {pcre_free_study(this->extra);}
+
+  if (this->expr!=NULL) {; gc_free(this->expr); } ;
+  if (this!=NULL) {; gc_free(this); } ;
  }
- if (this!=NULL) {if (this->name!=NULL) {; gc_free(this->name); } };
- if (this!=NULL) {; gc_free(this); } ;
 }
 
 const char* Token_expr(ParsingElement* this) {
@@ -2344,6 +2651,10 @@ ParsingElement* Group_new(Reference* children[]) {
  return this;
 }
 
+ParsingElement* Group_newNamed(const char* name, Reference* children[]) {
+ return ParsingElement_name(Group_new(children), name);
+}
+
 Match* Group_recognize(ParsingElement* this, ParsingContext* context){
 
 
@@ -2402,6 +2713,10 @@ ParsingElement* Rule_new(Reference* children[]) {
  return this;
 }
 
+ParsingElement* Rule_newNamed(const char* name, Reference* children[]) {
+ return ParsingElement_name(Rule_new(children), name);
+}
+
 Match* Rule_recognize (ParsingElement* this, ParsingContext* context){
 
 
@@ -2705,6 +3020,7 @@ ParsingContext* ParsingContext_new( Grammar* g, Iterator* iterator ) {
  this->lastMatchOffset = 0;
  this->lastMatchLength = 0;
  this->lastMatchElementID = -1;
+ this->matches = MatchArena_new();
  return this;
 }
 
@@ -2714,6 +3030,7 @@ void ParsingContext_free( ParsingContext* this ) {
   if (this->freeIterator) {Iterator_free(this->iterator);}
   ParsingVariable_freeAll(this->variables);
   ParsingStats_free(this->stats);
+  MatchArena_free(this->matches);
   if (this!=NULL) {; gc_free(this); } ;
  }
 }
@@ -1,7 +1,7 @@
 #!/usr/bin/env python2.7
 import os, sys ; sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/src/python")
 from libparsing import *
-import unittest
+import unittest, weakref, gc
 
 # -----------------------------------------------------------------------------
 #
@@ -263,6 +263,155 @@ class TestCollection(unittest.TestCase):
 		res = p.process(r.match)
 		self.assertEqual(res, (b"+", ("N", 1), ("N", 10)))
 
+	def testWalk( self ):
+		g = Grammar(isVerbose = False)
+		s = g.symbols
+		g.token("NUMBER",   "\d+")
+		g.token("OPERATOR", "[\+\-*\/]")
+		g.rule ("Operation", s.NUMBER._as("left"), s.OPERATOR._as("op"), s.NUMBER._as("right"))
+		g.axiom = s.Operation
+		# The grammar walk visits each element once, in id order
+		steps = []
+		g.walk(lambda e, step: steps.append((step, e.id)))
+		self.assertEqual([_[0] for _ in steps], [_[1] for _ in steps])
+		self.assertEqual(steps[0][0], 0)
+		self.assertEqual(len(steps), len(set(steps)))
+		# The grammar tree has the same elements, with their depth
+		tree = g.tree()
+		self.assertEqual([_[1].id for _ in tree], [_[0] for _ in steps])
+		self.assertEqual(tree[0][0], 0)
+		self.assertEqual([_ for _ in tree if _[0] <= 1], g.tree(1))
+		# The match walk visits the matches depth-first
+		r = g.parseString("1+10")
+		matches = []
+		r.match.walk(lambda m, step: matches.append(m))
+		self.assertEqual(len(matches), lib.Match_countAll(r.match._cobject) + 1)
+		# Returning a negative value stops the walk
+		visited = []
+		r.match.walk(lambda m, step: visited.append(step) or -1)
+		self.assertEqual(visited, [0])
+		# Walking a match doesn't walk its next siblings
+		first   = Match.Wrap(r.match._cobject.children)
+		visited = []
+		first.walk(lambda m, step: visited.append(m))
+		self.assertEqual(visited[0], first)
+		self.assertTrue(first._cobject.next)
+		self.assertNotIn(Match.Wrap(first._cobject.next), visited)
+
+	def testWrapCache( self ):
+		a = Word("a")
+		r = Reference(a)
+		# Wrapping a C object returns the wrapper that was already created
+		self.assertIs(ParsingElement.Wrap(a._cobject), a)
+		self.assertIs(r.element, a)
+		self.assertIs(Reference.Wrap(r._cobject), r)
+		self.assertEqual(hash(ParsingElement.Wrap(a._cobject)), hash(a))
+		g = Grammar(isVerbose = False)
+		g.axiom = Rule(a, Word("b"))
+		# NOTE: The result is kept, as it frees the matches when deleted
+		result = g.parseString("ab")
+		m = result.match
+		self.assertIs(m[0], m[0])
+
+	def testCallbackLifetime( self ):
+		# The callbacks of conditions and procedures that are only referenced
+		# from the C side are kept alive, and then kept by the grammar.
+		calls = []
+		g = Grammar(isVerbose = False)
+		g.axiom = Rule(Word("a"), Procedure(lambda e, c: calls.append(e)))
+		gc.collect()
+		self.assertTrue(g.parseString("a").isSuccess())
+		self.assertTrue(calls)
+		self.assertEqual(len(g._callbacks), 1)
+
+	def testWalkWrappers( self ):
+		# Walks return the existing wrappers, with the type of the C element
+		a = Word("a")
+		g = Grammar(isVerbose = False)
+		g.axiom = Rule(a)
+		elements = [e for d, e in g.tree()]
+		self.assertTrue(any(e is a for e in elements))
+		for e in elements:
+			self.assertEqual(isinstance(e, Reference), e.type == TYPE_REFERENCE)
+		walked = []
+		g.walk(lambda e, step: walked.append(e))
+		self.assertEqual(walked, elements)
+
+	def testWrapCacheEviction( self ):
+		g = Grammar(isVerbose = False)
+		a = g.word("A", "a")
+		g.axiom = g.rule("R", a, a)
+		address = hash(a)
+		del g
+		# The wrappers of the elements freed with the grammar are detached,
+		# and are not returned for objects allocated at the same address.
+		self.assertIsNone(a._cobject)
+		self.assertNotIn(address, CObject._CACHE)
+		# Detached wrappers keep their hash, so they can still be found
+		self.assertEqual(hash(a), address)
+		self.assertIn(a, set([a]))
+
+	def testTokenShared( self ):
+		# Tokens with the same expression share their compiled expression,
+		# even across grammars, while a token with that expression is alive.
+		g = Grammar(isVerbose = False)
+		g.token("NUMBER", "\d+")
+		g.axiom = g.symbols.NUMBER
+		self.assertTrue(g.parseString("123").isSuccess())
+		del g
+		h = Grammar(isVerbose = False)
+		h.token("VALUE", "\d+")
+		h.axiom = h.symbols.VALUE
+		self.assertTrue(h.parseString("456").isSuccess())
+		self.assertFalse(h.parseString("abc").isSuccess())
+		if HAS_TOKEN_SHARED:
+			a = Token("x+")
+			b = Token("x+", name="X")
+			self.assertIs(a._config, b._config)
+			config = weakref.ref(a._config)
+			del a, b
+			gc.collect()
+			self.assertIsNone(config())
+
+	def testNamedElements( self ):
+		self.assertEqual(Word("a", name="A").name, "A")
+		self.assertEqual(Token("\d+", name="NUMBER").name, "NUMBER")
+		self.assertEqual(Rule(Word("b"), name="R").name, "R")
+		self.assertEqual(Group(name="G").name, "G")
+		self.assertIsNone(Word("a").name)
+		g = Grammar(isVerbose = False)
+		self.assertEqual(g.word("LP", "(").name, "LP")
+		self.assertIs(g.symbols.LP, g.symbol("LP"))
+
+	def testSymbols( self ):
+		g = Grammar(isVerbose = False)
+		self.assertTrue(g.symbols)
+		self.assertRaises(AttributeError, lambda: g.symbols.A)
+		self.assertRaises(AttributeError, lambda: g.symbols["A"])
+		self.assertRaises(AttributeError, g.symbol, "A")
+		a = g.word("A", "a")
+		self.assertIs(g.symbols.A, a)
+		self.assertIs(g.symbols["A"], a)
+		self.assertEqual(g.list(), [("A", a)])
+
+	def testDefine( self ):
+		g = Grammar(isVerbose = False)
+		number, op = g.define(
+			("token", "NUMBER",   "\d+"),
+			("word",  "OPERATOR", "+"),
+		)
+		g.define(("rule", "Sum", (number, op, number)))
+		self.assertIs(g.symbols.NUMBER, number)
+		self.assertEqual(g.symbols.Sum.name, "Sum")
+		g.axiom = g.symbols.Sum
+		self.assertTrue(g.parseString("1+2").isSuccess())
+		self.assertRaises(Exception, g.define, ("regexp", "X", "x"))
+		self.assertRaises(Exception, g.define, ("word", "Y", "y"), ("regexp", "X", "x"))
+		self.assertNotIn("Y", g.symbols)
+		# Symbols can have any name, including the ones of methods
+		update, = g.define(("word", "update", "u"))
+		self.assertIs(g.symbols.update, update)
+
 	def testParsingContext( self ):
 		c = ParsingContext(None, None)
 		# Default state